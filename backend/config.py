@@ -1,11 +1,12 @@
 from functools import lru_cache
-from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
-
-load_dotenv()
+from typing import Annotated
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
 
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False)
+
     # Supabase Configuration
     supabase_url: str
     supabase_anon_key: str
@@ -14,12 +15,20 @@ class Settings(BaseSettings):
     # Application Configuration
     environment: str
     log_level: str
-    cors_origins: str
+    cors_origins: Annotated[list[str], NoDecode]
 
     # File Upload Configuration
     max_file_size: int
     allowed_mime_types: str
     thumbnail_size: int
+    thumbnail_workers: int = 2
+
+    @field_validator("cors_origins", mode="before")
+    @classmethod
+    def split_cors_origins(cls, v):
+        if isinstance(v, str):
+            return [origin.strip() for origin in v.split(",") if origin.strip()]
+        return v
 
 
 @lru_cache()
@@ -1,18 +1,41 @@
 from functools import lru_cache
-from supabase import Client, create_client
+import httpx
+from supabase import Client, ClientOptions, create_client
 from config import get_settings
 
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=120, max_keepalive_connections=80)
+HTTP_TIMEOUT = httpx.Timeout(120.0)
+
+
+@lru_cache()
+def get_http_client() -> httpx.Client:
+    # One keep-alive pool shared by every Supabase sub-client
+    return httpx.Client(
+        limits=HTTP_POOL_LIMITS,
+        timeout=HTTP_TIMEOUT,
+        http2=True,
+        follow_redirects=True,
+    )
+
 
 @lru_cache()
 def get_supabase_client() -> Client:
     settings = get_settings()
-    return create_client(settings.supabase_url, settings.supabase_service_key)
+    return create_client(
+        settings.supabase_url,
+        settings.supabase_service_key,
+        options=ClientOptions(httpx_client=get_http_client()),
+    )
 
 
 @lru_cache()
 def get_supabase_anon_client() -> Client:
     settings = get_settings()
-    return create_client(settings.supabase_url, settings.supabase_anon_key)
+    return create_client(
+        settings.supabase_url,
+        settings.supabase_anon_key,
+        options=ClientOptions(httpx_client=get_http_client()),
+    )
 
 
 def get_db() -> Client:
@@ -1,29 +1,64 @@
-import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import logging
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from config import get_settings
+from database import get_http_client, get_supabase_client, get_supabase_anon_client
 from routers import auth, files
+from services.auth_service import AuthServiceError
+from services.thumbnail_service import shutdown_thumbnail_pool
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm cached clients so the first request doesn't pay for construction
+    get_supabase_client()
+    get_supabase_anon_client()
+    yield
+    shutdown_thumbnail_pool()
+    get_http_client().close()
+
+
 app = FastAPI(
     title="File Management API",
     description="MetAI Full-Stack Interview - File Management System",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
-allowed_origins_str = os.getenv("CORS_ORIGINS", "").split(",")
-allowed_origins = [origin.strip() for origin in allowed_origins_str if origin.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 
+@app.exception_handler(AuthServiceError)
+async def auth_service_error_handler(request: Request, exc: AuthServiceError):
+    return ORJSONResponse(
+        status_code=exc.status_code,
+        content={"success": False, "data": None, "error": str(exc)},
+    )
+
+
+@app.exception_handler(Exception)
+async def unhandled_error_handler(request: Request, exc: Exception):
+    logger.error("Unhandled error on %s: %s", request.url.path, exc)
+    return ORJSONResponse(
+        status_code=500,
+        content={"success": False, "data": None, "error": "Internal server error"},
+    )
+
+
 @app.get("/")
 def root():
     return {"message": "File Management API", "status": "running"}
@@ -31,7 +66,7 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "environment": settings}
+    return {"status": "healthy", "environment": settings.environment}
 
 
 # Register routers
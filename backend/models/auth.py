@@ -1,40 +1,63 @@
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel, EmailStr, Field, field_validator
+from uuid import UUID
+import re
+import string
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+UPPERCASE_CHARS = frozenset(string.ascii_uppercase)
+LOWERCASE_CHARS = frozenset(string.ascii_lowercase)
+DIGIT_CHARS = frozenset(string.digits)
+
+
+def check_email_format(email: str) -> str:
+    if not EMAIL_PATTERN.fullmatch(email):
+        raise ValueError("Invalid email address")
+    return email
 
 
 class SignupRequest(BaseModel):
-    email: EmailStr = Field(..., description="User email address")
+    email: str = Field(..., description="User email address")
     password: str = Field(..., min_length=8, description="User password (min 8 chars)")
 
+    @field_validator("email")
+    @classmethod
+    def validate_email(cls, v: str) -> str:
+        return check_email_format(v)
+
     @field_validator("password")
     @classmethod
     def validate_password(cls, v: str) -> str:
         """
         Validate password meets requirements:
-        - At least 8 characters
+        - At least 8 characters (enforced by min_length)
         - At least one uppercase letter
         - At least one lowercase letter
         - At least one number
         """
-        if len(v) < 8:
-            raise ValueError("Password must be at least 8 characters")
-        if not any(c.isupper() for c in v):
+        chars = set(v)
+        if UPPERCASE_CHARS.isdisjoint(chars):
             raise ValueError("Password must contain at least one uppercase letter")
-        if not any(c.islower() for c in v):
+        if LOWERCASE_CHARS.isdisjoint(chars):
             raise ValueError("Password must contain at least one lowercase letter")
-        if not any(c.isdigit() for c in v):
+        if DIGIT_CHARS.isdisjoint(chars):
             raise ValueError("Password must contain at least one number")
         return v
 
 
 class LoginRequest(BaseModel):
-    email: EmailStr = Field(..., description="User email address")
+    email: str = Field(..., description="User email address")
     password: str = Field(..., description="User password")
 
+    @field_validator("email")
+    @classmethod
+    def validate_email(cls, v: str) -> str:
+        return check_email_format(v)
+
 
 class User(BaseModel):
-    id: str = Field(..., description="User UUID")
+    id: UUID = Field(..., description="User UUID")
     email: str = Field(..., description="User email address")
     created_at: datetime = Field(..., description="Account creation timestamp")
 
@@ -48,6 +71,8 @@ class AuthData(BaseModel):
 
 
 class AuthResponse(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     success: bool = Field(default=True, description="Operation success status")
     data: Optional[AuthData] = Field(None, description="Authentication data")
     error: Optional[str] = Field(None, description="Error message if failed")
@@ -58,12 +83,16 @@ class LogoutData(BaseModel):
 
 
 class LogoutResponse(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     success: bool = Field(default=True, description="Operation success status")
     data: Optional[LogoutData] = Field(None, description="Logout data")
     error: Optional[str] = Field(None, description="Error message if failed")
 
 
 class CurrentUserResponse(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     success: bool = Field(default=True, description="Operation success status")
     data: Optional[User] = Field(None, description="Current user data")
     error: Optional[str] = Field(None, description="Error message if failed")
@@ -1,7 +1,10 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from datetime import datetime
 from uuid import UUID
 from typing import Optional
+import re
+
+INVALID_FILENAME_CHARS = re.compile(r'[<>"\'`\n\r\t\0/\\]')
 
 
 class FileMetadata(BaseModel):
@@ -11,6 +14,7 @@ class FileMetadata(BaseModel):
     file_size: int = Field(..., gt=0, le=52428800)  # 50MB max
     storage_path: str
     thumbnail_url: Optional[str] = None
+    thumbnail_storage_path: Optional[str] = None
     has_thumbnail: bool = False
     uploaded_at: datetime
 
@@ -25,9 +29,7 @@ class FileUploadRequest(BaseModel):
     @classmethod
     def validate_filename(cls, v: str) -> str:
         # Sanitize filename (remove path traversal, control chars)
-        import re
-
-        if re.search(r'[<>"\'`\n\r\t\0/\\]', v):
+        if INVALID_FILENAME_CHARS.search(v):
             raise ValueError("Filename contains invalid characters")
         if ".." in v:
             raise ValueError("Filename cannot contain path traversal")
@@ -35,19 +37,26 @@ class FileUploadRequest(BaseModel):
 
 
 class FileListResponse(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     files: list[FileMetadata]
-    total: int
-    page: int
+    total: Optional[int] = None
+    page: Optional[int] = None  # None when paging by cursor
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class FileUploadResponse(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     file: FileMetadata
     message: str = "File uploaded successfully"
 
 
 class ErrorResponse(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     success: bool = False
     error: dict
     data: None = None
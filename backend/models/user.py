@@ -1,7 +1,9 @@
-from typing import Optional, TypedDict
+from dataclasses import dataclass
+from typing import Optional
 
 
-class SupabaseUser(TypedDict):
+@dataclass(slots=True, frozen=True)
+class SupabaseUser:
     id: str
     email: str
     created_at: str
@@ -11,12 +13,14 @@ class SupabaseUser(TypedDict):
     updated_at: Optional[str]
 
 
-class SupabaseAuthResponse(TypedDict):
+@dataclass(slots=True, frozen=True)
+class SupabaseAuthResponse:
     user: SupabaseUser
     session: Optional["SupabaseSession"]
 
 
-class SupabaseSession(TypedDict):
+@dataclass(slots=True, frozen=True)
+class SupabaseSession:
     access_token: str
     token_type: str
     expires_in: int
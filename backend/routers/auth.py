@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, status
+from fastapi.security import HTTPAuthorizationCredentials
 from supabase import Client
 
 from database import get_supabase_client
@@ -11,7 +12,12 @@ from models.auth import (
     CurrentUserResponse,
     User,
 )
-from services.auth_service import AuthService, get_current_user
+from services.auth_service import (
+    AuthService,
+    evict_cached_token,
+    get_current_user,
+    security,
+)
 
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
@@ -27,13 +33,10 @@ router = APIRouter(prefix="/auth", tags=["authentication"])
 async def signup(
     request: SignupRequest, supabase: Client = Depends(get_supabase_client)
 ) -> AuthResponse:
-    try:
-        auth_service = AuthService(supabase)
-        auth_data = await auth_service.signup(request)
+    auth_service = AuthService(supabase)
+    auth_data = await auth_service.signup(request)
 
-        return AuthResponse(success=True, data=auth_data, error=None)
-    except Exception as e:
-        return AuthResponse(success=False, data=None, error=str(e))
+    return AuthResponse(success=True, data=auth_data, error=None)
 
 
 @router.post(
@@ -46,13 +49,10 @@ async def signup(
 async def login(
     request: LoginRequest, supabase: Client = Depends(get_supabase_client)
 ) -> AuthResponse:
-    try:
-        auth_service = AuthService(supabase)
-        auth_data = await auth_service.login(request)
+    auth_service = AuthService(supabase)
+    auth_data = await auth_service.login(request)
 
-        return AuthResponse(success=True, data=auth_data, error=None)
-    except Exception as e:
-        return AuthResponse(success=False, data=None, error=str(e))
+    return AuthResponse(success=True, data=auth_data, error=None)
 
 
 @router.post(
@@ -62,15 +62,14 @@ async def login(
     summary="User logout",
     description="Logout user and invalidate session",
 )
-async def logout(current_user: User = Depends(get_current_user)) -> LogoutResponse:
-    try:
-        result = {"message": "Successfully logged out"}
-
-        return LogoutResponse(
-            success=True, data=LogoutData(message=result["message"]), error=None
-        )
-    except Exception as e:
-        return LogoutResponse(success=False, data=None, error=str(e))
+async def logout(
+    current_user: User = Depends(get_current_user),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> LogoutResponse:
+    evict_cached_token(credentials.credentials)
+    return LogoutResponse(
+        success=True, data=LogoutData(message="Successfully logged out"), error=None
+    )
 
 
 @router.get(
@@ -81,7 +80,4 @@ async def logout(current_user: User = Depends(get_current_user)) -> LogoutRespon
     description="Get current authenticated user information",
 )
 async def get_me(current_user: User = Depends(get_current_user)) -> CurrentUserResponse:
-    try:
-        return CurrentUserResponse(success=True, data=current_user, error=None)
-    except Exception as e:
-        return CurrentUserResponse(success=False, data=None, error=str(e))
+    return CurrentUserResponse(success=True, data=current_user, error=None)
@@ -5,74 +5,203 @@ from fastapi import (
     UploadFile,
     File,
     Query,
-    BackgroundTasks,
+    Request,
 )
 from fastapi.responses import RedirectResponse
-from supabase import Client
+from pydantic import TypeAdapter
 from uuid import UUID, uuid4
-from typing import Annotated
+from typing import Annotated, Optional
+import asyncio
 import logging
-from database import get_supabase_client
+import os
+import tempfile
 from services.auth_service import get_current_user
 from models.auth import User
 from models.file import FileMetadata, FileListResponse, FileUploadResponse
-from services.file_service import FileService
-from services.storage_service import StorageService
+from services.file_service import (
+    FILE_TOO_LARGE_MESSAGE,
+    MAX_FILE_SIZE,
+    FileService,
+    decode_cursor,
+    get_file_service,
+)
+from services.storage_service import StorageService, get_storage_service
 from services.thumbnail_service import generate_thumbnail
 
 router = APIRouter(prefix="/files", tags=["files"])
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BODY_SIZE = MAX_FILE_SIZE + 64 * 1024  # allow for multipart framing
+FILE_METADATA_LIST_ADAPTER = TypeAdapter(list[FileMetadata])
+
+# Strong references to detached tasks (thumbnails, upload cleanup) so they
+# aren't garbage collected before they finish
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task failed: %s", task.exception())
+
+
+def _start_background_task(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+
+async def _spool_upload(file: UploadFile, max_size: int) -> tuple[str, int]:
+    """
+    Stream the upload to a temp file on disk, returning its path and size.
+
+    Spooling stops once the size passes max_size, so the returned size is only
+    exact for uploads within the limit.
+    """
+    file_size = 0
+    with tempfile.NamedTemporaryFile(delete=False) as spool:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            file_size += len(chunk)
+            if file_size > max_size:
+                break
+            spool.write(chunk)
+    return spool.name, file_size
+
+
+def _remove_spool(spool_path: str) -> None:
+    try:
+        os.unlink(spool_path)
+    except FileNotFoundError:
+        pass
+
+
+async def _discard_reserved_upload(
+    file_id: UUID,
+    user_id: UUID,
+    stored_paths: list[str],
+    thumbnail_task: Optional[asyncio.Task],
+    thumbnail_abandoned: asyncio.Event,
+    storage_service: StorageService,
+    file_service: FileService,
+) -> None:
+    """Remove the pending row and any objects of an upload that didn't finish."""
+    if thumbnail_task:
+        # Cancelling wouldn't stop a render in the pool or a PUT already
+        # handed to a thread, so the thumbnail could land after the delete.
+        # Flag the task to skip its remaining steps and let it run out instead
+        thumbnail_abandoned.set()
+        await asyncio.gather(thumbnail_task, return_exceptions=True)
+
+    # The thumbnail task is finished, so nothing can be written after this
+    for result in await asyncio.gather(
+        file_service.delete_file_metadata(file_id=file_id, user_id=user_id),
+        storage_service.delete_files(stored_paths),
+        return_exceptions=True,
+    ):
+        if isinstance(result, Exception):
+            logger.error("Error cleaning up failed upload %s: %s", file_id, result)
+
+
+async def _reclaim_stale_reservation(
+    user_id: UUID,
+    filename: str,
+    storage_service: StorageService,
+    file_service: FileService,
+) -> bool:
+    """Free a filename held by an abandoned pending row, returning True if freed."""
+    stale_row = await file_service.reclaim_stale_reservation(
+        user_id=user_id, filename=filename
+    )
+    if not stale_row:
+        return False
+
+    logger.info("Reclaimed stale upload reservation %s", stale_row["id"])
+    try:
+        await storage_service.delete_files(
+            [
+                stale_row["storage_path"],
+                storage_service.generate_thumbnail_path(
+                    str(user_id), str(stale_row["id"])
+                ),
+            ]
+        )
+    except Exception as e:
+        logger.error(
+            "Error removing objects of stale upload %s: %s", stale_row["id"], e
+        )
+    return True
+
 
 async def _generate_and_upload_thumbnail(
-    file_content: bytes,
+    spool_path: str,
     file_id: UUID,
-    user_id: str,
+    user_id: UUID,
+    abandoned: asyncio.Event,
     storage_service: StorageService,
     file_service: FileService,
 ) -> None:
     try:
-        thumbnail_bytes = await generate_thumbnail(file_content)
+        thumbnail_bytes = await generate_thumbnail(spool_path)
+        if abandoned.is_set():
+            return
 
         # Upload thumbnail to storage
         thumbnail_path = await storage_service.upload_thumbnail(
-            user_id=user_id,
+            user_id=str(user_id),
             file_id=str(file_id),
             thumbnail_data=thumbnail_bytes,
         )
+        if abandoned.is_set():
+            return
 
         await file_service.update_thumbnail_metadata(
             file_id=file_id,
             has_thumbnail=True,
-            thumbnail_url=thumbnail_path,
+            thumbnail_storage_path=thumbnail_path,
         )
 
-    except Exception as e:
-        await file_service.update_thumbnail_metadata(
-            file_id=file_id,
-            has_thumbnail=False,
-        )
+    except Exception:
+        if abandoned.is_set():
+            return
+        try:
+            await file_service.update_thumbnail_metadata(
+                file_id=file_id,
+                has_thumbnail=False,
+            )
+        except Exception as e:
+            logger.error("Error recording failed thumbnail for %s: %s", file_id, e)
+    finally:
+        _remove_spool(spool_path)
 
 
 @router.post("/upload", response_model=FileUploadResponse, status_code=201)
 async def upload_file(
+    request: Request,
     file: Annotated[UploadFile, File()],
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client),
+    file_service: FileService = Depends(get_file_service),
+    storage_service: StorageService = Depends(get_storage_service),
 ):
-    file_service = FileService(supabase)
-    storage_service = StorageService(supabase)
+    # Reject requests that declare an oversized body before touching the file
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BODY_SIZE:
+        raise HTTPException(status_code=413, detail=FILE_TOO_LARGE_MESSAGE)
+
+    spool_path = None
+    spool_handed_off = False
 
     try:
-        # Validate file size
-        file.file.seek(0, 2)  # Seek to end
-        file_size = file.file.tell()
-        file.file.seek(0)  # Reset to beginning
+        # Stream the upload to disk and validate its actual size
+        spool_path, file_size = await _spool_upload(file, MAX_FILE_SIZE)
         try:
             file_service.validate_file_size(file_size)
         except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
+            # Same status as the Content-Length precheck for bodies that lied
+            # about or omitted their length
+            status_code = 413 if file_size > MAX_FILE_SIZE else 400
+            raise HTTPException(status_code=status_code, detail=str(e))
 
         # Sanitize filename
         try:
@@ -82,65 +211,117 @@ async def upload_file(
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-        # Check for duplicate filename
-        existing_file = await file_service.check_duplicate_filename(
-            user_id=UUID(current_user.id), filename=sanitized_filename
-        )
-        if existing_file:
-            raise HTTPException(
-                status_code=409,
-                detail={
-                    "message": "File with this name already exists",
-                    "existing_file": {
-                        "id": existing_file["id"],
-                        "filename": existing_file["filename"],
-                        "file_size": existing_file["file_size"],
-                        "uploaded_at": existing_file["uploaded_at"],
-                    },
-                },
-            )
-
         file_id = uuid4()
         storage_path = file_service.generate_storage_path(
-            user_id=UUID(current_user.id),
+            user_id=current_user.id,
             file_id=file_id,
             filename=sanitized_filename,
         )
-        file_content = await file.read()
-        await storage_service.upload_file(
-            file_path=storage_path,
-            file_data=file_content,
-            content_type=file.content_type,
-        )
 
-        # Create metadata record
-        file_metadata = await file_service.create_file_metadata(
-            user_id=UUID(current_user.id),
+        # Reserve the filename with a pending row; the unique (user_id, filename)
+        # constraint rejects duplicates before any bytes are uploaded, and
+        # listings and downloads skip the row until it is marked ready
+        reservation = dict(
+            user_id=current_user.id,
             file_id=file_id,
             filename=sanitized_filename,
             file_size=file_size,
             storage_path=storage_path,
         )
+        file_metadata = await file_service.create_file_metadata(**reservation)
+        if not file_metadata and await _reclaim_stale_reservation(
+            user_id=current_user.id,
+            filename=sanitized_filename,
+            storage_service=storage_service,
+            file_service=file_service,
+        ):
+            file_metadata = await file_service.create_file_metadata(**reservation)
+        if not file_metadata:
+            existing_file = await file_service.check_duplicate_filename(
+                user_id=current_user.id, filename=sanitized_filename
+            )
+            # No ready row means the name is held by an upload still in flight
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "File with this name already exists"
+                    if existing_file
+                    else "A file with this name is currently being uploaded",
+                    "existing_file": {
+                        "id": existing_file["id"],
+                        "filename": existing_file["filename"],
+                        "file_size": existing_file["file_size"],
+                        "uploaded_at": existing_file["uploaded_at"],
+                    }
+                    if existing_file
+                    else None,
+                },
+            )
 
         is_image = file_service.is_image_file(sanitized_filename)
-        logger.info(f"File '{sanitized_filename}' is_image: {is_image}")
+        logger.info("File '%s' is_image: %s", sanitized_filename, is_image)
 
-        if is_image:
-            logger.info(
-                f"Adding thumbnail generation task to background_tasks for file {file_id}"
-            )
-            background_tasks.add_task(
-                _generate_and_upload_thumbnail,
-                file_content=file_content,
-                file_id=file_id,
-                user_id=current_user.id,
-                storage_service=storage_service,
-                file_service=file_service,
-            )
-        else:
-            logger.info(
-                f"Skipping thumbnail generation for non-image file: {sanitized_filename}"
-            )
+        thumbnail_task = None
+        thumbnail_abandoned = asyncio.Event()
+        upload_complete = False
+        try:
+            with open(spool_path, "rb") as spool:
+                # Start the thumbnail before uploading the original so both
+                # uploads overlap; the task owns the spool from here and removes
+                # it when done, which is safe because the original is open
+                if is_image:
+                    logger.info("Starting thumbnail generation for file %s", file_id)
+                    thumbnail_task = _start_background_task(
+                        _generate_and_upload_thumbnail(
+                            spool_path=spool_path,
+                            file_id=file_id,
+                            user_id=current_user.id,
+                            abandoned=thumbnail_abandoned,
+                            storage_service=storage_service,
+                            file_service=file_service,
+                        )
+                    )
+                    spool_handed_off = True
+                else:
+                    logger.info(
+                        "Skipping thumbnail generation for non-image file: %s",
+                        sanitized_filename,
+                    )
+
+                await storage_service.upload_file(
+                    file_path=storage_path,
+                    file_data=spool,
+                    content_type=file.content_type,
+                )
+                file_metadata = await file_service.mark_file_ready(
+                    file_id=file_id, user_id=current_user.id
+                )
+                upload_complete = True
+        finally:
+            # Runs on errors and on cancellation (client disconnect, shutdown)
+            # alike; detached and shielded so the reservation is never left
+            # behind holding the filename
+            if not upload_complete:
+                stored_paths = [storage_path]
+                if thumbnail_task:
+                    stored_paths.append(
+                        storage_service.generate_thumbnail_path(
+                            str(current_user.id), str(file_id)
+                        )
+                    )
+                await asyncio.shield(
+                    _start_background_task(
+                        _discard_reserved_upload(
+                            file_id=file_id,
+                            user_id=current_user.id,
+                            stored_paths=stored_paths,
+                            thumbnail_task=thumbnail_task,
+                            thumbnail_abandoned=thumbnail_abandoned,
+                            storage_service=storage_service,
+                            file_service=file_service,
+                        )
+                    )
+                )
 
         return FileUploadResponse(
             file=FileMetadata(**file_metadata), message="File uploaded successfully"
@@ -149,71 +330,91 @@ async def upload_file(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error uploading file: {str(e)}")
+        logger.error("Error uploading file: %s", e)
         raise HTTPException(
             status_code=500, detail="Internal server error during file upload"
         )
+    finally:
+        if spool_path and not spool_handed_off:
+            _remove_spool(spool_path)
 
 
 @router.get("", response_model=FileListResponse)
 async def list_files(
-    page: int = Query(1, ge=1, description="Page number (1-indexed)"),
+    page: int = Query(
+        1, ge=1, description="Page number (1-indexed); ignored with cursor"
+    ),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
     sort_by: str = Query("uploaded_at", description="Sort field: name, date, size"),
     sort_order: str = Query("desc", description="Sort order: asc, desc"),
+    cursor: Optional[str] = Query(
+        None, description="Cursor from a previous page's next_cursor"
+    ),
+    include_total: bool = Query(
+        False, description="Also return total counts when paging by cursor"
+    ),
     current_user: User = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client),
+    file_service: FileService = Depends(get_file_service),
+    storage_service: StorageService = Depends(get_storage_service),
 ):
-    file_service = FileService(supabase)
-    storage_service = StorageService(supabase)
+    try:
+        after = decode_cursor(cursor, sort_by, sort_order) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        files, total_count = await file_service.list_user_files(
-            user_id=UUID(current_user.id),
+        files, total_count, next_cursor = await file_service.list_user_files(
+            user_id=current_user.id,
             page=page,
             page_size=page_size,
             sort_by=sort_by,
             sort_order=sort_order,
+            after=after,
+            include_total=after is None or include_total,
         )
-        total_pages = (
-            (total_count + page_size - 1) // page_size if total_count > 0 else 0
-        )
+        total_pages = None
+        if total_count is not None:
+            total_pages = (
+                (total_count + page_size - 1) // page_size if total_count > 0 else 0
+            )
+
+        # Generate pre-signed URLs for all thumbnails in one request
+        thumbnail_paths = [
+            file["thumbnail_storage_path"]
+            for file in files
+            if file.get("has_thumbnail") and file.get("thumbnail_storage_path")
+        ]
+        signed_urls = {}
+        if thumbnail_paths:
+            try:
+                signed_urls = await storage_service.generate_signed_urls(
+                    file_paths=thumbnail_paths,
+                    expiry_seconds=3600,  # 1 hour
+                )
+            except Exception as e:
+                logger.error("Failed to generate thumbnail URLs: %s", e)
 
-        # Generate pre-signed URLs for thumbnails
         for file in files:
-            if file.get("has_thumbnail"):
-                thumbnail_path = file.get("thumbnail_url")
-                if not thumbnail_path:
-                    storage_path = file["storage_path"]
-                    thumbnail_path = storage_path.rsplit("/", 1)[0] + "/thumbnail.webp"
-
-                try:
-                    signed_url = await storage_service.generate_signed_url(
-                        file_path=thumbnail_path,
-                        expiry_seconds=3600,  # 1 hour
-                    )
-                    file["thumbnail_url"] = signed_url
-                except Exception as e:
-                    logger.error(
-                        f"Failed to generate thumbnail URL for file {file['id']}: {str(e)}"
-                    )
-                    file["thumbnail_url"] = None
-            else:
-                file["thumbnail_url"] = None
+            thumbnail_path = file.get("thumbnail_storage_path")
+            file["thumbnail_url"] = (
+                signed_urls.get(thumbnail_path) if file.get("has_thumbnail") else None
+            )
 
-        # Convert to FileMetadata objects
-        file_metadata_list = [FileMetadata(**f) for f in files]
+        # Convert to FileMetadata objects in a single validation pass
+        file_metadata_list = FILE_METADATA_LIST_ADAPTER.validate_python(files)
 
         return FileListResponse(
             files=file_metadata_list,
             total=total_count,
-            page=page,
+            # A cursor page has no offset-based page number
+            page=None if after else page,
             page_size=page_size,
             total_pages=total_pages,
+            next_cursor=next_cursor,
         )
 
     except Exception as e:
-        logger.error(f"Error listing files: {str(e)}")
+        logger.error("Error listing files: %s", e)
         raise HTTPException(
             status_code=500, detail="Internal server error while listing files"
         )
@@ -223,43 +424,41 @@ async def list_files(
 async def delete_file(
     file_id: UUID,
     current_user: User = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client),
+    file_service: FileService = Depends(get_file_service),
+    storage_service: StorageService = Depends(get_storage_service),
 ):
-    file_service = FileService(supabase)
-    storage_service = StorageService(supabase)
-
     try:
         file_metadata = await file_service.get_file_metadata(
-            file_id=file_id, user_id=UUID(current_user.id)
+            file_id=file_id, user_id=current_user.id
         )
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
 
         storage_path = file_metadata["storage_path"]
-        try:
-            await storage_service.delete_file(storage_path)
-        except Exception as e:
-            logger.error(f"Error deleting file from storage: {str(e)}")
-
-        # Delete thumbnail if it exists
-        if file_metadata.get("has_thumbnail"):
-            thumbnail_path = storage_path.rsplit("/", 1)[0] + "/thumbnail.webp"
-            try:
-                await storage_service.delete_file(thumbnail_path)
-            except Exception as e:
-                logger.error(f"Error deleting thumbnail: {str(e)}")
-
-        # Delete metadata
-        await file_service.delete_file_metadata(
-            file_id=file_id, user_id=UUID(current_user.id)
+        storage_paths = [storage_path]
+        thumbnail_path = file_metadata.get("thumbnail_storage_path")
+        if file_metadata.get("has_thumbnail") and thumbnail_path:
+            storage_paths.append(thumbnail_path)
+
+        # Delete stored objects and metadata concurrently
+        storage_result, metadata_result = await asyncio.gather(
+            storage_service.delete_files(storage_paths),
+            file_service.delete_file_metadata(
+                file_id=file_id, user_id=current_user.id
+            ),
+            return_exceptions=True,
         )
+        if isinstance(storage_result, Exception):
+            logger.error("Error deleting file from storage: %s", storage_result)
+        if isinstance(metadata_result, Exception):
+            raise metadata_result
 
         return None
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting file: {str(e)}")
+        logger.error("Error deleting file: %s", e)
         raise HTTPException(
             status_code=500, detail="Internal server error during file deletion"
         )
@@ -269,15 +468,13 @@ async def delete_file(
 async def download_file(
     file_id: UUID,
     current_user: User = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client),
+    file_service: FileService = Depends(get_file_service),
+    storage_service: StorageService = Depends(get_storage_service),
 ):
-    file_service = FileService(supabase)
-    storage_service = StorageService(supabase)
-
     try:
         # Get file metadata to verify ownership
         file_metadata = await file_service.get_file_metadata(
-            file_id=file_id, user_id=UUID(current_user.id)
+            file_id=file_id, user_id=current_user.id
         )
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
@@ -292,7 +489,7 @@ async def download_file(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error generating download URL: {str(e)}")
+        logger.error("Error generating download URL: %s", e)
         raise HTTPException(
             status_code=500, detail="Internal server error during download"
         )
@@ -1,3 +1,10 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from typing import Optional
+from cachetools import TLRUCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import Client
@@ -8,6 +15,45 @@ from models.auth import User, AuthData, SignupRequest, LoginRequest
 
 security = HTTPBearer()
 
+TOKEN_CACHE_TTL = 60  # seconds
+TOKEN_CACHE_MAX_SIZE = 10_000
+
+
+def _token_cache_expiry(key: str, value: tuple, now: float) -> float:
+    # Never keep a user cached past the JWT's own expiry
+    _, expires_at = value
+    ttl = TOKEN_CACHE_TTL
+    if expires_at is not None:
+        ttl = min(ttl, expires_at - time.time())
+    return now + ttl
+
+
+_token_cache = TLRUCache(maxsize=TOKEN_CACHE_MAX_SIZE, ttu=_token_cache_expiry)
+
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _token_expiry(token: str) -> Optional[float]:
+    """Read the unverified `exp` claim; the token itself is verified by Supabase."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+def evict_cached_token(token: str) -> None:
+    _token_cache.pop(_token_cache_key(token), None)
+
+
+class AuthServiceError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class AuthService:
     def __init__(self, supabase: Client = Depends(get_supabase_client)):
@@ -15,14 +61,14 @@ class AuthService:
 
     async def signup(self, request: SignupRequest) -> AuthData:
         try:
-            response = self.supabase.auth.sign_up(
-                {"email": request.email, "password": request.password}
+            response = await asyncio.to_thread(
+                self.supabase.auth.sign_up,
+                {"email": request.email, "password": request.password},
             )
 
             if not response.user or not response.session:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to create user account",
+                raise AuthServiceError(
+                    status.HTTP_400_BAD_REQUEST, "Failed to create user account"
                 )
 
             user = User(
@@ -33,6 +79,8 @@ class AuthService:
 
             return AuthData(access_token=response.session.access_token, user=user)
 
+        except AuthServiceError:
+            raise
         except Exception as e:
             error_message = str(e).lower()
 
@@ -40,26 +88,24 @@ class AuthService:
                 "already registered" in error_message
                 or "already exists" in error_message
             ):
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Email already registered",
+                raise AuthServiceError(
+                    status.HTTP_409_CONFLICT, "Email already registered"
                 )
 
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Signup failed: {str(e)}",
+            raise AuthServiceError(
+                status.HTTP_400_BAD_REQUEST, f"Signup failed: {str(e)}"
             )
 
     async def login(self, request: LoginRequest) -> AuthData:
         try:
-            response = self.supabase.auth.sign_in_with_password(
-                {"email": request.email, "password": request.password}
+            response = await asyncio.to_thread(
+                self.supabase.auth.sign_in_with_password,
+                {"email": request.email, "password": request.password},
             )
 
             if not response.user or not response.session:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid credentials",
+                raise AuthServiceError(
+                    status.HTTP_401_UNAUTHORIZED, "Invalid credentials"
                 )
 
             user = User(
@@ -70,27 +116,32 @@ class AuthService:
 
             return AuthData(access_token=response.session.access_token, user=user)
 
-        except HTTPException:
+        except AuthServiceError:
             raise
         except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
-            )
+            raise AuthServiceError(status.HTTP_401_UNAUTHORIZED, "Invalid credentials")
 
     async def logout(self, token: str) -> dict:
+        evict_cached_token(token)
         try:
-            self.supabase.auth.set_session(token, token)
-            self.supabase.auth.sign_out()
+            await asyncio.to_thread(self._sign_out, token)
             return {"message": "Successfully logged out"}
 
         except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED, detail="Logout failed"
-            )
+            raise AuthServiceError(status.HTTP_401_UNAUTHORIZED, "Logout failed")
+
+    def _sign_out(self, token: str) -> None:
+        self.supabase.auth.set_session(token, token)
+        self.supabase.auth.sign_out()
 
     async def get_user_from_token(self, token: str) -> User:
+        cache_key = _token_cache_key(token)
+        cached = _token_cache.get(cache_key)
+        if cached is not None:
+            return cached[0]
+
         try:
-            response = self.supabase.auth.get_user(token)
+            response = await asyncio.to_thread(self.supabase.auth.get_user, token)
 
             if not response.user:
                 raise HTTPException(
@@ -104,6 +155,7 @@ class AuthService:
                 created_at=response.user.created_at,
             )
 
+            _token_cache[cache_key] = (user, _token_expiry(token))
             return user
 
         except HTTPException:
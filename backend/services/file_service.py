@@ -1,15 +1,103 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from postgrest.exceptions import APIError
 from supabase import Client
 from uuid import UUID
 from typing import Optional
+import asyncio
+import base64
+import json
 import re
 import logging
-from datetime import datetime
+import secrets
+import string
+
+from database import get_supabase_client
 
 logger = logging.getLogger(__name__)
 
 MAX_FILE_SIZE = 52428800  # 50MB in bytes
 MAX_FILENAME_LENGTH = 255
-ALLOWED_FILENAME_PATTERN = re.compile(r"^[a-zA-Z0-9._\-\s()]+$")
+FILE_TOO_LARGE_MESSAGE = (
+    f"File size exceeds maximum allowed size of {MAX_FILE_SIZE} bytes (50MB)"
+)
+UNIQUE_VIOLATION_CODE = "23505"
+RANGE_NOT_SATISFIABLE_CODE = "PGRST103"  # offset past the end with count=exact
+FILE_STATUS_PENDING = "pending"  # row reserved, storage upload in flight
+FILE_STATUS_READY = "ready"
+# A pending row older than this was left by an upload that died mid-flight
+STALE_RESERVATION_AGE = timedelta(hours=1)
+# Anything outside the allowed alphabet, plus control whitespace that \s would admit
+DISALLOWED_FILENAME_CHARS = re.compile(r"[^a-zA-Z0-9._\-\s()]|[\n\r\t]")
+# Deletes the plain ASCII subset of the allowed alphabet; a name that translates
+# to an empty string is valid without running the regex
+SAFE_FILENAME_CHARS_TABLE = str.maketrans(
+    "", "", string.ascii_letters + string.digits + "._- ()"
+)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+SORT_FIELD_MAP = {
+    "name": "filename",
+    "date": "uploaded_at",
+    "size": "file_size",
+    "uploaded_at": "uploaded_at",
+    "filename": "filename",
+    "file_size": "file_size",
+}
+
+
+def resolve_sort(sort_by: str, sort_order: str) -> tuple[str, str]:
+    """Map request sort parameters to a (column, "asc" | "desc") pair."""
+    sort_field = SORT_FIELD_MAP.get(sort_by, "uploaded_at")
+    return sort_field, "asc" if sort_order.lower() == "asc" else "desc"
+
+
+def _is_valid_sort_value(sort_field: str, sort_value) -> bool:
+    if sort_field == "file_size":
+        return type(sort_value) is int
+    if not isinstance(sort_value, str):
+        return False
+    if sort_field == "uploaded_at":
+        try:
+            datetime.fromisoformat(sort_value)
+        except ValueError:
+            return False
+    return True
+
+
+def encode_cursor(sort_field: str, sort_order: str, sort_value, file_id: str) -> str:
+    payload = json.dumps(
+        [sort_field, sort_order, sort_value, file_id], separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    """
+    Decode a pagination cursor into its (sort_value, id) keyset.
+
+    The cursor must have been issued for the same sort as the request, and
+    its sort value must have the type of that column.
+    """
+    try:
+        cursor_field, cursor_order, sort_value, file_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+        file_id = str(UUID(file_id))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+    if (cursor_field, cursor_order) != resolve_sort(sort_by, sort_order):
+        raise ValueError("Pagination cursor does not match the requested sort")
+    if not _is_valid_sort_value(cursor_field, sort_value):
+        raise ValueError("Invalid pagination cursor")
+    return sort_value, file_id
+
+
+def _quote_filter_value(value) -> str:
+    # PostgREST reads reserved characters literally inside double quotes, with
+    # backslash escaping a quote or backslash
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
 
 
 class FileService:
@@ -18,24 +106,25 @@ class FileService:
 
     def sanitize_filename(self, filename: str) -> str:
         if not filename or not filename.strip():
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            return f"untitled_{timestamp}"
+            return f"untitled_{secrets.token_hex(4)}"
 
         # Remove path components
-        filename = filename.split("/")[-1].split("\\")[-1]
+        filename = filename.rpartition("/")[2].rpartition("\\")[2]
 
         # Check for path traversal
         if ".." in filename:
             raise ValueError("Filename cannot contain path traversal sequences")
 
-        # Check for control characters and script injection
-        if re.search(r'[<>"\'`\n\r\t\0]', filename):
+        # Check for control characters, script injection and anything outside
+        # the allowed pattern; plain ASCII names skip the regex scan
+        is_plain = filename.isascii() and not filename.translate(
+            SAFE_FILENAME_CHARS_TABLE
+        )
+        if not filename or (
+            not is_plain and DISALLOWED_FILENAME_CHARS.search(filename)
+        ):
             raise ValueError("Filename contains invalid characters")
 
-        # Validate against allowed pattern
-        if not ALLOWED_FILENAME_PATTERN.match(filename):
-            raise ValueError("Filename contains characters outside allowed pattern")
-
         # Check filename length
         if len(filename) > MAX_FILENAME_LENGTH:
             raise ValueError(
@@ -49,28 +138,25 @@ class FileService:
             raise ValueError("File size must be greater than 0")
 
         if file_size > MAX_FILE_SIZE:
-            raise ValueError(
-                f"File size exceeds maximum allowed size of {MAX_FILE_SIZE} bytes (50MB)"
-            )
+            raise ValueError(FILE_TOO_LARGE_MESSAGE)
 
     async def check_duplicate_filename(
         self, user_id: UUID, filename: str
     ) -> Optional[dict]:
         try:
-            response = (
+            response = await asyncio.to_thread(
                 self.supabase.table("files")
-                .select("*")
+                .select("id, filename, file_size, uploaded_at")
                 .eq("user_id", str(user_id))
                 .eq("filename", filename)
-                .execute()
+                .eq("status", FILE_STATUS_READY)
+                .limit(1)
+                .execute
             )
 
-            if response.data and len(response.data) > 0:
-                return response.data[0]
-
-            return None
+            return response.data[0] if response.data else None
         except Exception as e:
-            logger.error(f"Error checking duplicate filename: {str(e)}")
+            logger.error("Error checking duplicate filename: %s", e)
             raise
 
     async def create_file_metadata(
@@ -80,7 +166,8 @@ class FileService:
         filename: str,
         file_size: int,
         storage_path: str,
-    ) -> dict:
+    ) -> Optional[dict]:
+        """Insert a metadata row, returning None if the filename is already taken."""
         try:
             file_data = {
                 "id": str(file_id),
@@ -89,27 +176,75 @@ class FileService:
                 "file_size": file_size,
                 "storage_path": storage_path,
                 "has_thumbnail": False,
-                "uploaded_at": datetime.utcnow().isoformat(),
+                "status": FILE_STATUS_PENDING,
             }
 
-            response = self.supabase.table("files").insert(file_data).execute()
+            response = await asyncio.to_thread(
+                self.supabase.table("files").insert(file_data).execute
+            )
 
             if not response.data or len(response.data) == 0:
                 raise ValueError("Failed to create file metadata")
 
+            return response.data[0]
+        except APIError as e:
+            if e.code == UNIQUE_VIOLATION_CODE:
+                return None
+            logger.error("Error creating file metadata: %s", e)
+            raise
+        except Exception as e:
+            logger.error("Error creating file metadata: %s", e)
+            raise
+
+    async def reclaim_stale_reservation(
+        self, user_id: UUID, filename: str
+    ) -> Optional[dict]:
+        """Delete an abandoned pending row holding filename, returning it if found."""
+        cutoff = datetime.now(timezone.utc) - STALE_RESERVATION_AGE
+        try:
+            response = await asyncio.to_thread(
+                self.supabase.table("files")
+                .delete()
+                .eq("user_id", str(user_id))
+                .eq("filename", filename)
+                .eq("status", FILE_STATUS_PENDING)
+                .lt("uploaded_at", cutoff.isoformat())
+                .execute
+            )
+
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error("Error reclaiming stale reservation: %s", e)
+            raise
+
+    async def mark_file_ready(self, file_id: UUID, user_id: UUID) -> dict:
+        """Publish a pending row once its object is in storage, returning the row."""
+        try:
+            response = await asyncio.to_thread(
+                self.supabase.table("files")
+                .update({"status": FILE_STATUS_READY})
+                .eq("id", str(file_id))
+                .eq("user_id", str(user_id))
+                .execute
+            )
+
+            if not response.data:
+                raise ValueError("Failed to mark file as ready")
+
             return response.data[0]
         except Exception as e:
-            logger.error(f"Error creating file metadata: {str(e)}")
+            logger.error("Error marking file as ready: %s", e)
             raise
 
     async def get_file_metadata(self, file_id: UUID, user_id: UUID) -> Optional[dict]:
         try:
-            response = (
+            response = await asyncio.to_thread(
                 self.supabase.table("files")
-                .select("*")
+                .select("id, storage_path, has_thumbnail, thumbnail_storage_path")
                 .eq("id", str(file_id))
                 .eq("user_id", str(user_id))
-                .execute()
+                .eq("status", FILE_STATUS_READY)
+                .execute
             )
 
             if response.data and len(response.data) > 0:
@@ -117,22 +252,44 @@ class FileService:
 
             return None
         except Exception as e:
-            logger.error(f"Error getting file metadata: {str(e)}")
+            logger.error("Error getting file metadata: %s", e)
+            raise
+
+    async def get_files_metadata(
+        self, file_ids: list[UUID], user_id: UUID
+    ) -> dict[UUID, dict]:
+        """Fetch metadata for several files in one request, keyed by file id."""
+        if not file_ids:
+            return {}
+
+        try:
+            response = await asyncio.to_thread(
+                self.supabase.table("files")
+                .select("id, storage_path, has_thumbnail, thumbnail_storage_path")
+                .eq("user_id", str(user_id))
+                .eq("status", FILE_STATUS_READY)
+                .in_("id", [str(file_id) for file_id in file_ids])
+                .execute
+            )
+
+            return {UUID(row["id"]): row for row in response.data or []}
+        except Exception as e:
+            logger.error("Error getting files metadata: %s", e)
             raise
 
     async def delete_file_metadata(self, file_id: UUID, user_id: UUID) -> bool:
         try:
-            response = (
+            response = await asyncio.to_thread(
                 self.supabase.table("files")
                 .delete()
                 .eq("id", str(file_id))
                 .eq("user_id", str(user_id))
-                .execute()
+                .execute
             )
 
             return True
         except Exception as e:
-            logger.error(f"Error deleting file metadata: {str(e)}")
+            logger.error("Error deleting file metadata: %s", e)
             raise
 
     async def list_user_files(
@@ -142,75 +299,116 @@ class FileService:
         page_size: int = 20,
         sort_by: str = "uploaded_at",
         sort_order: str = "desc",
-    ) -> tuple[list[dict], int]:
+        after: Optional[tuple] = None,
+        include_total: bool = True,
+    ) -> tuple[list[dict], Optional[int], Optional[str]]:
+        """
+        List a page of the user's files.
+
+        When `after` (a decoded cursor) is given, the page is fetched by keyset
+        on (sort field, id) instead of by offset. The total count is only
+        queried when include_total is set.
+        """
         try:
-            sort_field_map = {
-                "name": "filename",
-                "date": "uploaded_at",
-                "size": "file_size",
-                "uploaded_at": "uploaded_at",
-                "filename": "filename",
-                "file_size": "file_size",
-            }
-
-            sort_field = sort_field_map.get(sort_by, "uploaded_at")
-
-            # Get total count
-            count_response = (
-                self.supabase.table("files")
-                .select("id", count="exact")
-                .eq("user_id", str(user_id))
-                .execute()
-            )
-            total_count = (
-                count_response.count if hasattr(count_response, "count") else 0
-            )
-
-            # Get paginated data
-            offset = (page - 1) * page_size
+            sort_field, sort_order = resolve_sort(sort_by, sort_order)
+            descending = sort_order == "desc"
 
+            # Offset pages get the exact count on the same request via
+            # Content-Range; keyset pages are filtered, so they count separately
+            count_inline = include_total and not after
             query = (
                 self.supabase.table("files")
                 .select(
-                    "id, user_id, filename, file_size, storage_path, thumbnail_url, has_thumbnail, uploaded_at"
+                    "id, user_id, filename, file_size, storage_path, thumbnail_storage_path, has_thumbnail, uploaded_at",
+                    count="exact" if count_inline else None,
                 )
                 .eq("user_id", str(user_id))
+                .eq("status", FILE_STATUS_READY)
             )
 
-            # Apply sorting
-            if sort_order.lower() == "asc":
-                query = query.order(sort_field, desc=False)
-            else:
-                query = query.order(sort_field, desc=True)
+            if after:
+                sort_value, last_id = after
+                op = "lt" if descending else "gt"
+                quoted = _quote_filter_value(sort_value)
+                query = query.or_(
+                    f"{sort_field}.{op}.{quoted},"
+                    f"and({sort_field}.eq.{quoted},id.{op}.{last_id})"
+                )
+
+            # Apply sorting, with id as a tie-breaker for stable keysets
+            query = query.order(sort_field, desc=descending).order(
+                "id", desc=descending
+            )
 
             # Apply pagination
+            offset = 0 if after else (page - 1) * page_size
             query = query.range(offset, offset + page_size - 1)
 
-            response = query.execute()
+            total_count = None
+            if include_total and after:
+                # The sync client blocks, so overlap both requests in threads
+                total_count, response = await asyncio.gather(
+                    self._count_user_files(user_id),
+                    asyncio.to_thread(query.execute),
+                )
+            else:
+                try:
+                    response = await asyncio.to_thread(query.execute)
+                except APIError as e:
+                    # With count=exact PostgREST answers 416 for an offset past
+                    # the end instead of an empty page; the error carries no
+                    # count, so fetch it separately
+                    if e.code != RANGE_NOT_SATISFIABLE_CODE:
+                        raise
+                    return [], await self._count_user_files(user_id), None
+                if count_inline:
+                    total_count = response.count or 0
+
+            files = response.data or []
+
+            next_cursor = None
+            if len(files) == page_size:
+                last = files[-1]
+                next_cursor = encode_cursor(
+                    sort_field, sort_order, last[sort_field], last["id"]
+                )
 
-            return response.data or [], total_count
+            return files, total_count, next_cursor
         except Exception as e:
-            logger.error(f"Error listing user files: {str(e)}")
+            logger.error("Error listing user files: %s", e)
             raise
 
+    async def _count_user_files(self, user_id: UUID) -> int:
+        response = await asyncio.to_thread(
+            self.supabase.table("files")
+            .select("id", count="exact", head=True)
+            .eq("user_id", str(user_id))
+            .eq("status", FILE_STATUS_READY)
+            .execute
+        )
+        return response.count or 0
+
     def is_image_file(self, filename: str) -> bool:
-        image_extensions = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
-        ext = filename.lower().split(".")[-1] if "." in filename else ""
-        return f".{ext}" in image_extensions
+        return filename.lower().endswith(IMAGE_EXTENSIONS)
 
     def generate_storage_path(self, user_id: UUID, file_id: UUID, filename: str) -> str:
         return f"{user_id}/{file_id}/{filename}"
 
     async def update_thumbnail_metadata(
-        self, file_id: UUID, has_thumbnail: bool, thumbnail_url: str = None
+        self, file_id: UUID, has_thumbnail: bool, thumbnail_storage_path: str = None
     ) -> None:
         update_data = {"has_thumbnail": has_thumbnail}
-        if thumbnail_url:
-            update_data["thumbnail_url"] = thumbnail_url
+        if thumbnail_storage_path:
+            update_data["thumbnail_storage_path"] = thumbnail_storage_path
 
-        response = (
+        response = await asyncio.to_thread(
             self.supabase.table("files")
             .update(update_data)
             .eq("id", str(file_id))
-            .execute()
+            .execute
         )
+
+
+@lru_cache()
+def get_file_service() -> FileService:
+    return FileService(get_supabase_client())
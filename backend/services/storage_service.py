@@ -1,9 +1,35 @@
+from functools import lru_cache
+from cachetools import TLRUCache
 from supabase import Client
 from typing import BinaryIO, Optional
+import asyncio
 import logging
 
+from database import get_supabase_client
+
 logger = logging.getLogger(__name__)
 
+SIGNED_URL_CACHE_MAX_SIZE = 50_000
+SIGNED_URL_CACHE_MARGIN = 300  # seconds before expiry that a cached URL is dropped
+
+
+def _signed_url_cache_expiry(key: str, value: tuple, now: float) -> float:
+    _, expiry_seconds = value
+    return now + expiry_seconds - SIGNED_URL_CACHE_MARGIN
+
+
+# file_path -> (signed_url, expiry_seconds)
+_signed_url_cache = TLRUCache(
+    maxsize=SIGNED_URL_CACHE_MAX_SIZE, ttu=_signed_url_cache_expiry
+)
+
+
+def _cached_signed_url(file_path: str, expiry_seconds: int) -> Optional[str]:
+    cached = _signed_url_cache.get(file_path)
+    if cached is not None and cached[1] == expiry_seconds:
+        return cached[0]
+    return None
+
 
 class StorageService:
     def __init__(self, supabase: Client):
@@ -18,58 +44,126 @@ class StorageService:
             if content_type:
                 options["content-type"] = content_type
 
-            response = self.supabase.storage.from_(self.bucket_name).upload(
-                path=file_path, file=file_data, file_options=options
+            response = await asyncio.to_thread(
+                self.supabase.storage.from_(self.bucket_name).upload,
+                path=file_path,
+                file=file_data,
+                file_options=options,
             )
 
             return response
         except Exception as e:
-            logger.error(f"Failed to upload file to {file_path}: {str(e)}")
+            logger.error("Failed to upload file to %s: %s", file_path, e)
             raise
 
     async def delete_file(self, file_path: str) -> None:
         try:
-            self.supabase.storage.from_(self.bucket_name).remove([file_path])
+            await asyncio.to_thread(
+                self.supabase.storage.from_(self.bucket_name).remove, [file_path]
+            )
+            _signed_url_cache.pop(file_path, None)
+        except Exception as e:
+            logger.error("Failed to delete file at %s: %s", file_path, e)
+            raise
+
+    async def delete_files(self, file_paths: list[str]) -> None:
+        try:
+            await asyncio.to_thread(
+                self.supabase.storage.from_(self.bucket_name).remove, file_paths
+            )
+            for file_path in file_paths:
+                _signed_url_cache.pop(file_path, None)
         except Exception as e:
-            logger.error(f"Failed to delete file at {file_path}: {str(e)}")
+            logger.error("Failed to delete files at %s: %s", file_paths, e)
             raise
 
     async def generate_signed_url(
         self, file_path: str, expiry_seconds: int = 3600
     ) -> str:
+        cached_url = _cached_signed_url(file_path, expiry_seconds)
+        if cached_url:
+            return cached_url
+
         try:
-            response = self.supabase.storage.from_(self.bucket_name).create_signed_url(
-                path=file_path, expires_in=expiry_seconds
+            response = await asyncio.to_thread(
+                self.supabase.storage.from_(self.bucket_name).create_signed_url,
+                path=file_path,
+                expires_in=expiry_seconds,
             )
 
             if isinstance(response, dict) and "signedURL" in response:
-                return response["signedURL"]
+                signed_url = response["signedURL"]
+                _signed_url_cache[file_path] = (signed_url, expiry_seconds)
+                return signed_url
 
             raise ValueError("Failed to generate signed URL")
         except Exception as e:
-            logger.error(f"Failed to generate signed URL for {file_path}: {str(e)}")
+            logger.error("Failed to generate signed URL for %s: %s", file_path, e)
+            raise
+
+    async def generate_signed_urls(
+        self, file_paths: list[str], expiry_seconds: int = 3600
+    ) -> dict[str, str]:
+        """Sign several paths in one request; paths that fail are left out."""
+        signed_urls = {}
+        missing_paths = []
+        for file_path in file_paths:
+            cached_url = _cached_signed_url(file_path, expiry_seconds)
+            if cached_url:
+                signed_urls[file_path] = cached_url
+            else:
+                missing_paths.append(file_path)
+
+        if not missing_paths:
+            return signed_urls
+
+        try:
+            response = await asyncio.to_thread(
+                self.supabase.storage.from_(self.bucket_name).create_signed_urls,
+                paths=missing_paths,
+                expires_in=expiry_seconds,
+            )
+
+            for item in response:
+                if item.get("error") or not item.get("signedURL"):
+                    continue
+                signed_urls[item["path"]] = item["signedURL"]
+                _signed_url_cache[item["path"]] = (item["signedURL"], expiry_seconds)
+
+            return signed_urls
+        except Exception as e:
+            logger.error("Failed to generate signed URLs for %s: %s", file_paths, e)
             raise
 
     async def file_exists(self, file_path: str) -> bool:
         try:
-            files = self.supabase.storage.from_(self.bucket_name).list(
-                path="/".join(file_path.split("/")[:-1])
+            # HEAD the object itself; list()'s search is a case-insensitive
+            # prefix match, so it can't answer an exact-path question cheaply
+            return await asyncio.to_thread(
+                self.supabase.storage.from_(self.bucket_name).exists, file_path
             )
-            filename = file_path.split("/")[-1]
-            return any(f.get("name") == filename for f in files)
         except Exception as e:
-            logger.error(f"Failed to check if file exists at {file_path}: {str(e)}")
+            logger.error("Failed to check if file exists at %s: %s", file_path, e)
             return False
 
+    def generate_thumbnail_path(self, user_id: str, file_id: str) -> str:
+        return f"{user_id}/{file_id}/thumbnail.webp"
+
     async def upload_thumbnail(
         self, user_id: str, file_id: str, thumbnail_data: bytes
     ) -> str:
-        thumbnail_path = f"{user_id}/{file_id}/thumbnail.webp"
+        thumbnail_path = self.generate_thumbnail_path(user_id, file_id)
 
-        response = self.supabase.storage.from_(self.bucket_name).upload(
+        response = await asyncio.to_thread(
+            self.supabase.storage.from_(self.bucket_name).upload,
             path=thumbnail_path,
             file=thumbnail_data,
             file_options={"content-type": "image/webp"},
         )
 
         return thumbnail_path
+
+
+@lru_cache()
+def get_storage_service() -> StorageService:
+    return StorageService(get_supabase_client())
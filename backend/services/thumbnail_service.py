@@ -1,26 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from io import BytesIO
 from PIL import Image
+import asyncio
 import logging
 
+from config import get_settings
+
 logger = logging.getLogger(__name__)
 
 THUMBNAIL_SIZE = (100, 100)
 THUMBNAIL_FORMAT = "WebP"
 THUMBNAIL_BACKGROUND_COLOR = (255, 255, 255)
+THUMBNAIL_REDUCING_GAP = 2.0
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_WEBP_METHOD = 0  # fastest encoder effort; negligible loss at 100x100
+
+
+@lru_cache()
+def get_thumbnail_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=get_settings().thumbnail_workers)
 
 
-async def generate_thumbnail(image_bytes: bytes) -> bytes:
+def shutdown_thumbnail_pool() -> None:
+    # Skip creating a pool on shutdown if no thumbnail was ever generated
+    if get_thumbnail_pool.cache_info().currsize:
+        get_thumbnail_pool().shutdown()
+        get_thumbnail_pool.cache_clear()
+
+
+async def generate_thumbnail(image_path: str) -> bytes:
+    # Pillow work is CPU-bound; keep it off the event loop and across cores
+    loop = asyncio.get_running_loop()
+    pool = get_thumbnail_pool()
     try:
-        image = Image.open(BytesIO(image_bytes))
+        return await loop.run_in_executor(pool, _generate_thumbnail_sync, image_path)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a decompression bomb); replace the pool so
+        # later thumbnails don't keep failing, unless another call already has
+        logger.error("Thumbnail pool broke, replacing it")
+        if get_thumbnail_pool() is pool:
+            get_thumbnail_pool.cache_clear()
+        pool.shutdown(wait=False)
+        raise
 
-        # Convert to RGB if necessary (handles RGBA, grayscale, etc.)
-        if image.mode not in ("RGB", "L"):
-            if image.mode == "RGBA":
-                background = Image.new("RGB", image.size, THUMBNAIL_BACKGROUND_COLOR)
-                background.paste(image, mask=image.split()[3])
-                image = background
-            else:
-                image = image.convert("RGB")
+
+def _generate_thumbnail_sync(image_path: str) -> bytes:
+    try:
+        image = Image.open(image_path)
+
+        # Let JPEGs decode at a reduced DCT scale instead of full resolution
+        image.draft(
+            "RGB",
+            (
+                int(THUMBNAIL_SIZE[0] * THUMBNAIL_REDUCING_GAP),
+                int(THUMBNAIL_SIZE[1] * THUMBNAIL_REDUCING_GAP),
+            ),
+        )
+
+        # Convert to RGB if necessary (handles palette, CMYK, etc.). RGBA is
+        # premultiplied instead: Pillow only applies reducing_gap to modes it
+        # resizes directly, and it would premultiply RGBA itself anyway
+        if image.mode == "RGBA":
+            image = image.convert("RGBa")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
 
         # Calculate aspect ratio preserving dimensions
         image.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
@@ -31,15 +76,22 @@ async def generate_thumbnail(image_bytes: bytes) -> bytes:
         # Center the thumbnail on the canvas
         offset_x = (THUMBNAIL_SIZE[0] - image.size[0]) // 2
         offset_y = (THUMBNAIL_SIZE[1] - image.size[1]) // 2
-        canvas.paste(image, (offset_x, offset_y))
+        if image.mode == "RGBa":
+            image = image.convert("RGBA")
+            canvas.paste(image, (offset_x, offset_y), mask=image)
+        else:
+            canvas.paste(image, (offset_x, offset_y))
 
         # Save to bytes buffer as WebP
         buffer = BytesIO()
-        canvas.save(buffer, format=THUMBNAIL_FORMAT, quality=85)
-        buffer.seek(0)
-
+        canvas.save(
+            buffer,
+            format=THUMBNAIL_FORMAT,
+            quality=THUMBNAIL_QUALITY,
+            method=THUMBNAIL_WEBP_METHOD,
+        )
         return buffer.getvalue()
 
     except Exception as e:
-        logger.error(f"Failed to generate thumbnail: {str(e)}")
+        logger.error("Failed to generate thumbnail: %s", e)
         raise
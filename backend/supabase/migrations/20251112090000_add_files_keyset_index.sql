@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS idx_files_user_uploaded_id ON files(user_id, uploaded_at DESC, id DESC);
@@ -0,0 +1,13 @@
+BEGIN;
+
+ALTER TABLE files
+ADD COLUMN IF NOT EXISTS thumbnail_storage_path TEXT DEFAULT NULL;
+
+UPDATE files
+SET thumbnail_storage_path = COALESCE(
+    thumbnail_url,
+    regexp_replace(storage_path, '/[^/]*$', '') || '/thumbnail.webp'
+)
+WHERE has_thumbnail AND thumbnail_storage_path IS NULL;
+
+COMMIT;
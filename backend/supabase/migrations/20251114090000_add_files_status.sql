@@ -0,0 +1,9 @@
+BEGIN;
+
+-- Rows are inserted as 'pending' to reserve the filename and flipped to
+-- 'ready' once the storage object exists; existing rows are already uploaded
+ALTER TABLE files
+ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'ready'
+CHECK (status IN ('pending', 'ready'));
+
+COMMIT;
@@ -0,0 +1,16 @@
+import os
+
+# Settings are read from the environment on first use; give every required
+# field a dummy value so modules can be imported without a .env
+for name in (
+    "SUPABASE_URL",
+    "SUPABASE_ANON_KEY",
+    "SUPABASE_SERVICE_KEY",
+    "ENVIRONMENT",
+    "LOG_LEVEL",
+    "CORS_ORIGINS",
+    "ALLOWED_MIME_TYPES",
+):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("MAX_FILE_SIZE", "52428800")
+os.environ.setdefault("THUMBNAIL_SIZE", "100")
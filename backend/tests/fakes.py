@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+
+class FakeQuery:
+    """Records builder calls and returns a canned response from execute()."""
+
+    def __init__(self, data=None, count=None, error=None):
+        self.calls = []
+        self.response = SimpleNamespace(data=data, count=count)
+        self.error = error
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+
+        return method
+
+    def called(self, name):
+        return [call for call in self.calls if call[0] == name]
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return self.response
+
+
+class FakeSupabase:
+    """Hands out queued FakeQuery objects, one per table() call."""
+
+    def __init__(self, *queries):
+        self.queries = list(queries)
+
+    def table(self, name):
+        return self.queries.pop(0)
@@ -0,0 +1,47 @@
+import base64
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import services.auth_service as auth_module
+from services.auth_service import TOKEN_CACHE_TTL, _token_cache_expiry, _token_expiry
+
+WALL_CLOCK = 1_700_000_000.0
+MONOTONIC_NOW = 500.0
+
+
+@pytest.fixture(autouse=True)
+def frozen_time(monkeypatch):
+    monkeypatch.setattr(auth_module, "time", SimpleNamespace(time=lambda: WALL_CLOCK))
+
+
+def make_token(claims: dict) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode()
+    return f"header.{payload.rstrip('=')}.signature"
+
+
+@pytest.mark.parametrize(
+    "expires_at, ttl",
+    [
+        (None, TOKEN_CACHE_TTL),
+        (WALL_CLOCK + 3600, TOKEN_CACHE_TTL),
+        (WALL_CLOCK + 10, 10),
+        (WALL_CLOCK - 5, -5),
+    ],
+)
+def test_token_cache_ttl_is_clamped_to_token_expiry(expires_at, ttl):
+    expiry = _token_cache_expiry("key", ("user", expires_at), MONOTONIC_NOW)
+
+    assert expiry == MONOTONIC_NOW + ttl
+
+
+def test_token_expiry_reads_exp_claim():
+    assert _token_expiry(make_token({"sub": "u", "exp": 1234})) == 1234.0
+
+
+@pytest.mark.parametrize(
+    "token", ["not-a-jwt", "a.!!!.c", make_token({"sub": "u"}), make_token([1])]
+)
+def test_token_expiry_is_none_for_unreadable_tokens(token):
+    assert _token_expiry(token) is None
@@ -0,0 +1,179 @@
+from uuid import uuid4
+import base64
+
+import pytest
+from postgrest.exceptions import APIError
+
+from services.file_service import (
+    DISALLOWED_FILENAME_CHARS,
+    FileService,
+    decode_cursor,
+    encode_cursor,
+)
+from tests.fakes import FakeQuery, FakeSupabase
+
+
+async def test_list_user_files_returns_total_on_page_past_the_end():
+    out_of_range = APIError(
+        {
+            "code": "PGRST103",
+            "message": "Requested range not satisfiable",
+            "details": "An offset of 19980 was requested, but there are only 5 rows.",
+            "hint": None,
+        }
+    )
+    page_query = FakeQuery(error=out_of_range)
+    count_query = FakeQuery(count=5)
+    service = FileService(FakeSupabase(page_query, count_query))
+
+    files, total, next_cursor = await service.list_user_files(
+        user_id=uuid4(), page=999, page_size=20
+    )
+
+    assert (files, total, next_cursor) == ([], 5, None)
+    assert count_query.called("select")[0][2] == {"count": "exact", "head": True}
+
+
+async def test_list_user_files_reraises_other_api_errors():
+    page_query = FakeQuery(
+        error=APIError({"code": "42P01", "message": "boom", "details": None, "hint": None})
+    )
+    service = FileService(FakeSupabase(page_query))
+
+    with pytest.raises(APIError):
+        await service.list_user_files(user_id=uuid4())
+
+
+async def test_reclaim_stale_reservation_only_deletes_old_pending_rows():
+    user_id = uuid4()
+    query = FakeQuery(data=[{"id": str(uuid4()), "storage_path": "p"}])
+    service = FileService(FakeSupabase(query))
+
+    row = await service.reclaim_stale_reservation(user_id=user_id, filename="a.txt")
+
+    assert row is not None
+    assert query.called("delete")
+    filters = {call[1][0]: call[1][1] for call in query.called("eq")}
+    assert filters == {"user_id": str(user_id), "filename": "a.txt", "status": "pending"}
+    assert query.called("lt")[0][1][0] == "uploaded_at"
+
+
+async def test_check_duplicate_filename_ignores_pending_rows():
+    query = FakeQuery(data=[])
+    service = FileService(FakeSupabase(query))
+
+    assert await service.check_duplicate_filename(uuid4(), "a.txt") is None
+    assert ("eq", ("status", "ready"), {}) in query.calls
+
+
+async def test_get_files_metadata_fetches_ready_rows_in_one_query():
+    user_id, first_id, second_id = uuid4(), uuid4(), uuid4()
+    query = FakeQuery(
+        data=[
+            {"id": str(first_id), "storage_path": "a"},
+            {"id": str(second_id), "storage_path": "b"},
+        ]
+    )
+    service = FileService(FakeSupabase(query))
+
+    rows = await service.get_files_metadata([first_id, second_id], user_id)
+
+    assert rows[first_id]["storage_path"] == "a"
+    assert rows[second_id]["storage_path"] == "b"
+    assert "*" not in query.called("select")[0][1][0]
+    assert ("eq", ("status", "ready"), {}) in query.calls
+    assert query.called("in_")[0][1] == ("id", [str(first_id), str(second_id)])
+
+
+async def test_get_files_metadata_skips_query_for_no_ids():
+    assert await FileService(FakeSupabase()).get_files_metadata([], uuid4()) == {}
+
+
+@pytest.mark.parametrize(
+    "sort_by, sort_field, sort_value",
+    [
+        ("name", "filename", 'report (v2), "final").txt'),
+        ("size", "file_size", 1024),
+        ("date", "uploaded_at", "2025-01-01T12:30:00.123456+00:00"),
+    ],
+)
+def test_cursor_round_trip(sort_by, sort_field, sort_value):
+    file_id = str(uuid4())
+    cursor = encode_cursor(sort_field, "asc", sort_value, file_id)
+
+    assert decode_cursor(cursor, sort_by, "ASC") == (sort_value, file_id)
+
+
+@pytest.mark.parametrize(
+    "sort_by, cursor",
+    [
+        ("filename", "not-base64!"),
+        ("filename", base64.urlsafe_b64encode(b"{}").decode()),
+        ("filename", encode_cursor("filename", "desc", "a.txt", "not-a-uuid")),
+        ("filename", encode_cursor("filename", "desc", ["a"], str(uuid4()))),
+        ("filename", encode_cursor("filename", "desc", {"a": 1}, str(uuid4()))),
+        ("file_size", encode_cursor("file_size", "desc", "10", str(uuid4()))),
+        ("file_size", encode_cursor("file_size", "desc", True, str(uuid4()))),
+        ("uploaded_at", encode_cursor("uploaded_at", "desc", "today", str(uuid4()))),
+    ],
+)
+def test_decode_cursor_rejects_malformed_cursors(sort_by, cursor):
+    with pytest.raises(ValueError, match="Invalid pagination cursor"):
+        decode_cursor(cursor, sort_by, "desc")
+
+
+@pytest.mark.parametrize(
+    "sort_by, sort_order", [("size", "desc"), ("name", "asc"), ("date", "desc")]
+)
+def test_decode_cursor_rejects_a_different_sort(sort_by, sort_order):
+    cursor = encode_cursor("filename", "desc", "a.txt", str(uuid4()))
+
+    with pytest.raises(ValueError, match="does not match"):
+        decode_cursor(cursor, sort_by, sort_order)
+
+
+async def test_list_user_files_quotes_cursor_values_in_keyset_filter():
+    last_id = str(uuid4())
+    query = FakeQuery(data=[])
+    service = FileService(FakeSupabase(query))
+
+    await service.list_user_files(
+        uuid4(),
+        sort_by="name",
+        sort_order="asc",
+        after=('a "b", (c).txt', last_id),
+        include_total=False,
+    )
+
+    assert query.called("or_")[0][1][0] == (
+        'filename.gt."a \\"b\\", (c).txt",'
+        f'and(filename.eq."a \\"b\\", (c).txt",id.gt.{last_id})'
+    )
+
+
+@pytest.mark.parametrize(
+    "char",
+    [chr(code) for code in range(128) if chr(code) not in "/\\"]
+    + ["\u00a0", "\u2003", "\u3000", "\u0085", "\u00e9", "\u4e2d"],
+)
+def test_sanitize_filename_fast_path_agrees_with_regex(char):
+    filename = f"a{char}b.txt"
+    service = FileService(FakeSupabase())
+
+    if DISALLOWED_FILENAME_CHARS.search(filename):
+        with pytest.raises(ValueError):
+            service.sanitize_filename(filename)
+    else:
+        assert service.sanitize_filename(filename) == filename
+
+
+@pytest.mark.parametrize("filename", ["a\nb.txt", "a\rb.txt", "a\tb.txt"])
+def test_sanitize_filename_rejects_control_whitespace(filename):
+    with pytest.raises(ValueError):
+        FileService(FakeSupabase()).sanitize_filename(filename)
+
+
+def test_sanitize_filename_allows_vertical_tab_like_the_regex():
+    # \s admits \x0b and only \n, \r, \t are excluded; the fast path must not
+    # change that
+    assert FileService(FakeSupabase()).sanitize_filename("a\x0bb.txt") == "a\x0bb.txt"
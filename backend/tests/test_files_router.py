@@ -0,0 +1,249 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+import routers.files as files_router
+from services.file_service import FILE_TOO_LARGE_MESSAGE
+
+
+def make_row(file_id, user_id, **overrides):
+    row = {
+        "id": str(file_id),
+        "user_id": str(user_id),
+        "filename": "report.txt",
+        "file_size": 3,
+        "storage_path": f"{user_id}/{file_id}/report.txt",
+        "has_thumbnail": False,
+        "uploaded_at": "2025-01-01T00:00:00+00:00",
+        "status": "ready",
+    }
+    row.update(overrides)
+    return row
+
+
+class FakeUploadFile:
+    def __init__(self, filename="report.txt", data=b"abc", content_type="text/plain"):
+        self.filename = filename
+        self.content_type = content_type
+        self._chunks = [data]
+
+    async def read(self, size):
+        return self._chunks.pop() if self._chunks else b""
+
+
+class FakeFileService:
+    def __init__(self):
+        self.calls = []
+        self.insert_results = []
+        self.stale_row = None
+        self.duplicate = None
+
+    def validate_file_size(self, file_size):
+        if file_size > files_router.MAX_FILE_SIZE:
+            raise ValueError(FILE_TOO_LARGE_MESSAGE)
+
+    def sanitize_filename(self, filename):
+        return filename
+
+    def generate_storage_path(self, user_id, file_id, filename):
+        return f"{user_id}/{file_id}/{filename}"
+
+    def is_image_file(self, filename):
+        return filename.endswith(".png")
+
+    async def create_file_metadata(self, **kwargs):
+        self.calls.append("insert")
+        result = self.insert_results.pop(0) if self.insert_results else True
+        if result:
+            return make_row(kwargs["file_id"], kwargs["user_id"], status="pending")
+        return None
+
+    async def reclaim_stale_reservation(self, user_id, filename):
+        self.calls.append("reclaim")
+        stale_row, self.stale_row = self.stale_row, None
+        return stale_row
+
+    async def check_duplicate_filename(self, user_id, filename):
+        return self.duplicate
+
+    async def mark_file_ready(self, file_id, user_id):
+        self.calls.append("ready")
+        return make_row(file_id, user_id)
+
+    async def delete_file_metadata(self, file_id, user_id):
+        self.calls.append("delete_row")
+
+    async def update_thumbnail_metadata(self, **kwargs):
+        self.calls.append(("thumbnail_metadata", kwargs["has_thumbnail"]))
+
+
+class FakeStorageService:
+    def __init__(self, upload_delay=0.0, upload_error=None, thumbnail_delay=0.0):
+        self.upload_delay = upload_delay
+        self.upload_error = upload_error
+        self.thumbnail_delay = thumbnail_delay
+        self.deleted = []
+        self.log = []
+
+    def generate_thumbnail_path(self, user_id, file_id):
+        return f"{user_id}/{file_id}/thumbnail.webp"
+
+    async def upload_file(self, **kwargs):
+        await asyncio.sleep(self.upload_delay)
+        if self.upload_error:
+            raise self.upload_error
+
+    async def upload_thumbnail(self, user_id, file_id, thumbnail_data):
+        await asyncio.sleep(self.thumbnail_delay)
+        self.log.append("put_thumbnail")
+        return self.generate_thumbnail_path(user_id, file_id)
+
+    async def delete_files(self, file_paths):
+        self.log.append("delete")
+        self.deleted.extend(file_paths)
+
+
+async def upload(file_service, storage_service, upload_file=None, headers=None):
+    return await files_router.upload_file(
+        request=SimpleNamespace(headers=headers or {}),
+        file=upload_file or FakeUploadFile(),
+        current_user=SimpleNamespace(id=uuid4()),
+        file_service=file_service,
+        storage_service=storage_service,
+    )
+
+
+async def test_upload_marks_reserved_row_ready():
+    file_service = FakeFileService()
+
+    response = await upload(file_service, FakeStorageService())
+
+    assert file_service.calls == ["insert", "ready"]
+    assert response.file.filename == "report.txt"
+
+
+async def test_failed_upload_removes_reservation():
+    file_service = FakeFileService()
+    storage_service = FakeStorageService(upload_error=RuntimeError("storage down"))
+
+    with pytest.raises(HTTPException) as exc_info:
+        await upload(file_service, storage_service)
+
+    assert exc_info.value.status_code == 500
+    assert file_service.calls == ["insert", "delete_row"]
+    assert len(storage_service.deleted) == 1
+
+
+async def test_cancelled_upload_removes_reservation():
+    file_service = FakeFileService()
+    storage_service = FakeStorageService(upload_delay=10)
+
+    task = asyncio.create_task(upload(file_service, storage_service))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # Cleanup is detached from the cancelled request; let it finish
+    await asyncio.gather(*files_router._background_tasks)
+
+    assert file_service.calls == ["insert", "delete_row"]
+    assert len(storage_service.deleted) == 1
+
+
+async def test_stale_reservation_is_reclaimed_and_insert_retried():
+    file_service = FakeFileService()
+    file_service.insert_results = [False, True]
+    stale_id, user_id = uuid4(), uuid4()
+    file_service.stale_row = make_row(stale_id, user_id, status="pending")
+    storage_service = FakeStorageService()
+
+    await upload(file_service, storage_service)
+
+    assert file_service.calls == ["insert", "reclaim", "insert", "ready"]
+    assert f"{user_id}/{stale_id}/report.txt" in storage_service.deleted
+
+
+async def test_conflict_with_upload_in_flight_does_not_describe_pending_row():
+    file_service = FakeFileService()
+    file_service.insert_results = [False]
+
+    with pytest.raises(HTTPException) as exc_info:
+        await upload(file_service, FakeStorageService())
+
+    assert exc_info.value.status_code == 409
+    assert exc_info.value.detail["existing_file"] is None
+    assert "being uploaded" in exc_info.value.detail["message"]
+
+
+async def test_conflict_with_ready_file_describes_it():
+    file_service = FakeFileService()
+    file_service.insert_results = [False]
+    file_service.duplicate = make_row(uuid4(), uuid4())
+
+    with pytest.raises(HTTPException) as exc_info:
+        await upload(file_service, FakeStorageService())
+
+    assert exc_info.value.status_code == 409
+    assert exc_info.value.detail["existing_file"]["id"] == file_service.duplicate["id"]
+
+
+async def test_failed_upload_waits_for_thumbnail_in_flight(monkeypatch):
+    async def fake_generate_thumbnail(spool_path):
+        return b"webp"
+
+    monkeypatch.setattr(files_router, "generate_thumbnail", fake_generate_thumbnail)
+    file_service = FakeFileService()
+    storage_service = FakeStorageService(
+        upload_delay=0.01,
+        upload_error=RuntimeError("storage down"),
+        thumbnail_delay=0.05,
+    )
+
+    with pytest.raises(HTTPException):
+        await upload(file_service, storage_service, FakeUploadFile(filename="a.png"))
+
+    # The thumbnail PUT lands before the cleanup deletes its path, and the
+    # row it belonged to is never updated
+    assert storage_service.log == ["put_thumbnail", "delete"]
+    assert any(path.endswith("thumbnail.webp") for path in storage_service.deleted)
+    assert file_service.calls == ["insert", "delete_row"]
+
+
+async def test_thumbnail_records_metadata_after_successful_upload(monkeypatch):
+    async def fake_generate_thumbnail(spool_path):
+        return b"webp"
+
+    monkeypatch.setattr(files_router, "generate_thumbnail", fake_generate_thumbnail)
+    file_service = FakeFileService()
+
+    await upload(file_service, FakeStorageService(), FakeUploadFile(filename="a.png"))
+    await asyncio.gather(*files_router._background_tasks)
+
+    assert ("thumbnail_metadata", True) in file_service.calls
+
+
+async def test_oversized_declared_body_is_rejected_with_413():
+    file_service = FakeFileService()
+    headers = {"content-length": str(files_router.MAX_UPLOAD_BODY_SIZE + 1)}
+
+    with pytest.raises(HTTPException) as exc_info:
+        await upload(file_service, FakeStorageService(), headers=headers)
+
+    assert exc_info.value.status_code == 413
+    assert exc_info.value.detail == FILE_TOO_LARGE_MESSAGE
+    assert file_service.calls == []
+
+
+async def test_oversized_streamed_body_is_rejected_with_413(monkeypatch):
+    monkeypatch.setattr(files_router, "MAX_FILE_SIZE", 2)
+    file_service = FakeFileService()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await upload(file_service, FakeStorageService())
+
+    assert exc_info.value.status_code == 413
+    assert exc_info.value.detail == FILE_TOO_LARGE_MESSAGE
+    assert file_service.calls == []
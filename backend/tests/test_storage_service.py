@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+from cachetools import TLRUCache
+
+import services.storage_service as storage_module
+from services.storage_service import (
+    SIGNED_URL_CACHE_MARGIN,
+    StorageService,
+    _signed_url_cache_expiry,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBucket:
+    def __init__(self):
+        self.signed = []
+        self.removed = []
+
+    def create_signed_url(self, path, expires_in):
+        self.signed.append(path)
+        return {"signedURL": f"https://signed/{path}?n={len(self.signed)}"}
+
+    def create_signed_urls(self, paths, expires_in):
+        self.signed.extend(paths)
+        return [
+            {"path": path, "signedURL": f"https://signed/{path}?n={len(self.signed)}"}
+            for path in paths
+        ]
+
+    def remove(self, paths):
+        self.removed.extend(paths)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    cache = TLRUCache(maxsize=10, ttu=_signed_url_cache_expiry, timer=clock)
+    monkeypatch.setattr(storage_module, "_signed_url_cache", cache)
+    return clock
+
+
+@pytest.fixture
+def bucket():
+    return FakeBucket()
+
+
+@pytest.fixture
+def service(bucket):
+    storage = SimpleNamespace(from_=lambda bucket_name: bucket)
+    return StorageService(SimpleNamespace(storage=storage))
+
+
+async def test_signed_url_is_reused_until_the_margin_before_expiry(
+    clock, bucket, service
+):
+    first = await service.generate_signed_url("a.webp", expiry_seconds=3600)
+
+    clock.now += 3600 - SIGNED_URL_CACHE_MARGIN - 1
+    assert await service.generate_signed_url("a.webp", expiry_seconds=3600) == first
+
+    clock.now += 1
+    assert await service.generate_signed_url("a.webp", expiry_seconds=3600) != first
+    assert bucket.signed == ["a.webp", "a.webp"]
+
+
+async def test_signed_url_for_a_different_expiry_is_not_reused(clock, bucket, service):
+    await service.generate_signed_url("a.webp", expiry_seconds=3600)
+    await service.generate_signed_url("a.webp", expiry_seconds=600)
+
+    assert bucket.signed == ["a.webp", "a.webp"]
+
+
+async def test_bulk_signing_only_requests_uncached_paths(clock, bucket, service):
+    await service.generate_signed_url("a.webp")
+
+    urls = await service.generate_signed_urls(["a.webp", "b.webp"])
+
+    assert set(urls) == {"a.webp", "b.webp"}
+    assert bucket.signed == ["a.webp", "b.webp"]
+
+
+@pytest.mark.parametrize("delete", ["delete_file", "delete_files"])
+async def test_deleting_a_file_evicts_its_signed_url(clock, bucket, service, delete):
+    first = await service.generate_signed_url("a.webp")
+
+    if delete == "delete_file":
+        await service.delete_file("a.webp")
+    else:
+        await service.delete_files(["a.webp"])
+
+    assert bucket.removed == ["a.webp"]
+    assert await service.generate_signed_url("a.webp") != first
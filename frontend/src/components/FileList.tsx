@@ -23,7 +23,7 @@ export function FileList({ onFileListChange }: FileListProps) {
   });
 
   useEffect(() => {
-    if (data?.total !== undefined) {
+    if (data?.total != null) {
       pagination.setTotalItems(data.total);
     }
   }, [data?.total, pagination]);
@@ -96,7 +96,7 @@ export function FileList({ onFileListChange }: FileListProps) {
     <div className="space-y-4">
       <div className="flex items-center justify-between bg-white border border-gray-200 rounded-lg p-3">
         <span className="text-sm text-gray-600">
-          {getPageRangeText(pagination.page, pagination.pageSize, data.total)}
+          {getPageRangeText(pagination.page, pagination.pageSize, data.total ?? 0)}
         </span>
         <div className="flex gap-2">
           <span className="text-sm text-gray-600 mr-2">Sort by:</span>
@@ -17,12 +17,13 @@ export interface FileMetadata {
 
 export interface FileListResponse {
   files: FileMetadata[];
-  total: number;
-  page: number;
+  total: number | null;
+  page: number | null;
   page_size: number;
   pageSize?: number;
-  total_pages: number;
+  total_pages: number | null;
   totalPages?: number;
+  next_cursor?: string | null;
 }
 
 export interface FileUploadProgress {